@@ -205,20 +205,18 @@ export default function Home() {
         })
       );
 
-      const promises = holdings.map(async (stock) => {
-        try {
-          // Check if we already have data? No, let's refresh.
-          const res = await axios.get(`${API_URL}/price?code=${stock.code}`);
-          const { price, rate, change } = res.data;
-          return {
-            ...stock,
-            currentPrice: price,
-            rate,
-            change,
-            loading: false,
-          };
-        } catch (err) {
-          console.error(err);
+      let quotes: Record<string, { price: number, rate: number, change: string, error?: string }> = {};
+      try {
+        // One batched request for the whole portfolio
+        const res = await axios.post(`${API_URL}/prices`, { codes: holdings.map(h => h.code) });
+        quotes = res.data;
+      } catch (err) {
+        console.error(err);
+      }
+
+      const results = holdings.map((stock) => {
+        const quote = quotes[stock.code];
+        if (!quote || quote.error) {
           // Return default/error state
           return {
             ...stock,
@@ -227,9 +225,16 @@ export default function Home() {
             currentPrice: stock.buyPrice, // Fallback on error
           };
         }
+        const { price, rate, change } = quote;
+        return {
+          ...stock,
+          currentPrice: price,
+          rate,
+          change,
+          loading: false,
+        };
       });
 
-      const results = await Promise.all(promises);
       setStocksData(results);
     };
 
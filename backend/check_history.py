@@ -1,11 +1,4 @@
-import os
-from dotenv import load_dotenv
-from supabase import create_client
-
-load_dotenv()
-url = os.environ.get("SUPABASE_URL")
-key = os.environ.get("SUPABASE_KEY")
-supabase = create_client(url, key)
+from config import supabase
 
 print("--- Portfolio History Content ---")
 res = supabase.table("portfolio_history").select("*").execute()
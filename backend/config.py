@@ -0,0 +1,46 @@
+from dotenv import load_dotenv
+import os
+import httpx
+from supabase import create_client, Client, ClientOptions
+
+# Load env variables (once per process; import this module instead of repeating it)
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+# Shared secret for /admin/* (sent as X-Admin-Token); admin endpoints are off when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# fdr.StockListing names that can be loaded, and the market their rows are tagged with
+LISTING_MARKETS = {
+    'KRX': 'KR', 'KOSPI': 'KR', 'KOSDAQ': 'KR', 'KONEX': 'KR',
+    'NASDAQ': 'US', 'NYSE': 'US', 'AMEX': 'US',
+}
+DEFAULT_MARKETS = ['KRX', 'NASDAQ', 'NYSE', 'AMEX']
+
+def _parse_markets(value: str) -> list:
+    names = list(dict.fromkeys(m.strip().upper() for m in value.split(",") if m.strip()))
+    unknown = [m for m in names if m not in LISTING_MARKETS]
+    if unknown:
+        print(f"Ignoring unknown MARKETS entries {unknown}; expected any of {', '.join(LISTING_MARKETS)}")
+    names = [m for m in names if m in LISTING_MARKETS]
+    return names or DEFAULT_MARKETS
+
+# Listings loaded into the stock list, e.g. MARKETS=KOSPI,KOSDAQ,NASDAQ (default: KRX + all US)
+MARKETS = _parse_markets(os.getenv("MARKETS", ",".join(DEFAULT_MARKETS)))
+
+# Supabase Client
+supabase: Client = None
+if SUPABASE_URL and SUPABASE_KEY:
+    try:
+        # One explicitly sized keep-alive pool shared by PostgREST/storage/functions,
+        # so back-to-back queries reuse the TLS connection instead of re-handshaking
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30),
+            timeout=10.0,
+        )
+        supabase = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=http_client))
+        print("Supabase client initialized.")
+    except Exception as e:
+        print(f"Failed to initialize Supabase: {e}")
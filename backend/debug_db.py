@@ -1,18 +1,9 @@
-import os
-from dotenv import load_dotenv
-from supabase import create_client
+from config import supabase
 
-load_dotenv()
-
-url = os.environ.get("SUPABASE_URL")
-key = os.environ.get("SUPABASE_KEY")
-
-if not url or not key:
+if not supabase:
     print("Error: Missing credentials")
     exit(1)
 
-supabase = create_client(url, key)
-
 user_id = "debug_user"
 
 # Try to insert a dummy record with quantity
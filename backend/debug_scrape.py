@@ -1,15 +1,26 @@
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+import soupsieve as sv
 import re
 
+SEL_SECTION_SEARCH = sv.compile('.section_search')
+SEL_SEARCH_ROWS = sv.compile('table.tbl_search tbody tr')
+
+UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36'
+
+# Shared keep-alive session (pooled connections, small retry budget)
+SESSION = requests.Session()
+adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=Retry(total=2, backoff_factor=0.1))
+SESSION.mount('https://', adapter)
+SESSION.headers.update({'User-Agent': UA})
+
 url = "https://finance.naver.com/search/search.naver"
 params = {"query": "삼성"}
-headers = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36'
-}
 
-response = requests.get(url, params=params, headers=headers)
+response = SESSION.get(url, params=params)
 # response.encoding = 'EUC-KR'
 print(f"URL: {response.url}")
 print(f"Status: {response.status_code}")
@@ -47,10 +58,10 @@ for i, table in enumerate(tables):
 
 # Try to find specific section for stocks
 # Sometimes it's inside a div with class 'section_search'
-stock_section = soup.select_one('.section_search')
+stock_section = SEL_SECTION_SEARCH.select_one(soup)
 if stock_section:
     print("Found section_search")
-    rows = stock_section.select('table.tbl_search tbody tr')
+    rows = SEL_SEARCH_ROWS.select(stock_section)
     print(f"Rows in section: {len(rows)}")
 else:
     print("No section_search found")
@@ -1,4 +1,5 @@
 import FinanceDataReader as fdr
+import yfinance as yf
 import datetime
 import pandas as pd
 
@@ -29,7 +30,21 @@ def test_us_price(code):
     except Exception as e:
         print(f"ERROR: {e}")
 
+def test_us_prices_batch(codes):
+    # One multi-ticker Yahoo request instead of one per code
+    print(f"\nTesting batch {codes}...")
+    try:
+        df = yf.download(' '.join(codes), period='10d', group_by='ticker', threads=True, progress=False)
+
+        for code in codes:
+            closes = df[code]['Close'].dropna()
+            if closes.empty:
+                print(f"FAILED: Empty data for {code}")
+                continue
+            print(f"SUCCESS: {code} Price: {float(closes.iloc[-1])}")
+
+    except Exception as e:
+        print(f"ERROR: {e}")
+
 if __name__ == "__main__":
-    test_us_price("AAPL")
-    test_us_price("NVDA")
-    test_us_price("TSLA")
+    test_us_prices_batch(["AAPL", "NVDA", "TSLA"])
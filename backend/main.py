@@ -1,65 +1,350 @@
-from dotenv import load_dotenv
-import os
+import re
+import json
+import hashlib
+import secrets
+import time
+import pathlib
 import datetime
-from supabase import create_client, Client
 import contextlib
+from collections import OrderedDict
+import asyncio
+import numpy as np
 import pandas as pd
 import FinanceDataReader as fdr
-import requests
-from bs4 import BeautifulSoup
-from fastapi import FastAPI, HTTPException
+import yfinance as yf
+from numba import njit
+import httpx
+import lxml.html
+from lxml import etree
+from cachetools import TTLCache
+import orjson
+from fastapi import FastAPI, HTTPException, Header, Response, Request, Depends
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from brotli_asgi import BrotliMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, NamedTuple, Optional
+
+from config import supabase, MARKETS, LISTING_MARKETS, ADMIN_TOKEN
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36'
+
+# Naver price page selectors, compiled once (XPath equivalents of .class CSS selectors)
+def _cls(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+XP_PRICE = etree.XPath(f"(//*[{_cls('no_today')}]//*[{_cls('blind')}])[1]")
+XP_NO_EXDAY = etree.XPath(f"(//*[{_cls('no_exday')}])[1]")
+XP_BLIND = etree.XPath(f".//*[{_cls('blind')}]")
+XP_ICO_UP = etree.XPath(f".//*[{_cls('ico')} and ({_cls('up')} or {_cls('upper')})]")
+XP_ICO_DOWN = etree.XPath(f".//*[{_cls('ico')} and ({_cls('down')} or {_cls('low')})]")
+NAVER_PARSER = lxml.html.HTMLParser(encoding='euc-kr')
+
+# The same fields as raw-byte regexes; tags/classes are ASCII so EUC-KR bytes match directly
+# (each bounded to its own <p>, so a later "blind" span elsewhere on the page can't match)
+RE_NO_TODAY = re.compile(rb'class="no_today"[^>]*>(?:(?!</p>).)*?class="blind">([^<]+)<', re.S)
+RE_NO_EXDAY = re.compile(rb'class="no_exday"(.*?)</p>', re.S)
+RE_BLIND = re.compile(rb'class="blind">([^<]*)<')
+RE_ICO_UP = re.compile(rb'class="ico (?:up|upper)"')
+RE_ICO_DOWN = re.compile(rb'class="ico (?:down|low)"')
+# Any element carrying the "ico" class, whatever the class order
+RE_ICO_ANY = re.compile(rb'class="(?:[^"]*\s)?ico[\s"]')
+
+def _parse_naver_regex(content: bytes):
+    """Return (price, change, rate, is_up, is_down) texts from the Naver page, or None."""
+    today = RE_NO_TODAY.search(content)
+    exday = RE_NO_EXDAY.search(content)
+    if not today or not exday:
+        return None
+
+    exday_html = exday.group(1)
+    is_up = RE_ICO_UP.search(exday_html) is not None
+    is_down = RE_ICO_DOWN.search(exday_html) is not None
+    if not (is_up or is_down) and RE_ICO_ANY.search(exday_html):
+        # A sign icon we don't recognize: let the full parse read it rather than guess
+        return None
+
+    blinds = RE_BLIND.findall(exday_html)
+    change, rate = (blinds[0], blinds[1]) if len(blinds) >= 2 else (b"0", b"0")
+    return (
+        today.group(1).strip().decode('euc-kr'),
+        change.strip().decode('euc-kr'),
+        rate.strip().decode('euc-kr'),
+        is_up,
+        is_down,
+    )
+
+def _parse_naver_lxml(content: bytes):
+    """Full-parse fallback for _parse_naver_regex, in case the markup drifts."""
+    # lxml tree directly (no BeautifulSoup wrapper); the page is EUC-KR
+    tree = lxml.html.document_fromstring(content, parser=NAVER_PARSER)
+
+    price = XP_PRICE(tree)
+    exday = XP_NO_EXDAY(tree)
+    if not price or not exday:
+        return None
+
+    no_exday = exday[0]
+    blinds = XP_BLIND(no_exday)
+
+    change_text = "0"
+    rate_text = "0"
+    if len(blinds) >= 2:
+        change_text = blinds[0].text_content().strip()
+        rate_text = blinds[1].text_content().strip()
+
+    return (
+        price[0].text_content().strip(),
+        change_text,
+        rate_text,
+        bool(XP_ICO_UP(no_exday)),
+        bool(XP_ICO_DOWN(no_exday)),
+    )
+
+# Local cache for stock listings (refreshed daily)
+CACHE_DIR = pathlib.Path(__file__).parent / ".cache"
+LISTING_TTL = 86400
+
+def _is_fresh(path: pathlib.Path, ttl: int) -> bool:
+    return path.exists() and path.stat().st_mtime > time.time() - ttl
+
+def _load_listing_cached(name: str, ttl: int = LISTING_TTL):
+    """Load an fdr listing as ['Code', 'Name'], using the Parquet cache when fresh."""
+    path = CACHE_DIR / f"{name}.parquet"
+    if _is_fresh(path, ttl):
+        return pd.read_parquet(path)
+
+    df = fdr.StockListing(name)
+    df = df.rename(columns={'Symbol': 'Code'})[['Code', 'Name']]
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        df.to_parquet(path)
+    except Exception as e:
+        print(f"Failed to cache {name} listing: {e}")
+    return df
+
+class StockIndex(NamedTuple):
+    """Everything the endpoints need from the stock list, precomputed once per load.
+
+    names/codes/markets are the raw row values; name_buf/code_buf hold the lowercase UTF-8
+    of each column packed end to end with per-row offsets; sorted_codes/code_order are the
+    lowercase codes in sorted order (+ row positions) for prefix lookups. Replaced as a
+    whole on refresh, so readers never see a mix of generations.
+    """
+    name_buf: np.ndarray
+    name_offs: np.ndarray
+    code_buf: np.ndarray
+    code_offs: np.ndarray
+    sorted_codes: np.ndarray
+    code_order: np.ndarray
+    names: np.ndarray
+    codes: np.ndarray
+    markets: np.ndarray
+    code_to_idx: Dict[str, int]
+    # Identifies the stock list build; /search ETags change with it
+    version: str
+
+    def market_of(self, code: str, default: str = 'KR') -> str:
+        i = self.code_to_idx.get(code)
+        return default if i is None else self.markets[i]
+
+EMPTY_INDEX = StockIndex(
+    np.zeros(0, dtype=np.uint8), np.zeros(1, dtype=np.int64),
+    np.zeros(0, dtype=np.uint8), np.zeros(1, dtype=np.int64),
+    np.array([], dtype=str), np.array([], dtype=np.int64),
+    np.array([], dtype=object), np.array([], dtype=object), np.array([], dtype=object),
+    {}, "empty",
+)
 
-# Load env variables
-load_dotenv()
+def _pack_strings(values):
+    encoded = [v.lower().encode('utf-8') for v in values]
+    offs = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offs[1:])
+    buf = np.frombuffer(bytearray(b''.join(encoded)), dtype=np.uint8)
+    return buf, offs
+
+# Eager signatures: compiled at import (and cached on disk), not on the first /search
+@njit("boolean(uint8[::1], int64, int64, uint8[::1], int64[::1])", cache=True)
+def _contains(buf, start, end, needle, skip):
+    """Boyer-Moore-Horspool: does buf[start:end] contain needle?"""
+    m = needle.size
+    i = start
+    while i + m <= end:
+        k = m - 1
+        while k >= 0 and buf[i + k] == needle[k]:
+            k -= 1
+        if k < 0:
+            return True
+        i += skip[buf[i + m - 1]]
+    return False
+
+@njit("int64(uint8[::1], int64[::1], uint8[::1], int64[::1], uint8[::1], int64[::1])", cache=True)
+def _search(name_buf, name_offs, code_buf, code_offs, needle, out):
+    """Fill out with the first len(out) rows whose Name or Code contains needle; return the count."""
+    m = needle.size
+    skip = np.full(256, m, dtype=np.int64)
+    for j in range(m - 1):
+        skip[needle[j]] = m - 1 - j
+
+    # Single fused pass over both columns, stopping once out is full
+    n = 0
+    for r in range(name_offs.size - 1):
+        if (_contains(name_buf, name_offs[r], name_offs[r + 1], needle, skip)
+                or _contains(code_buf, code_offs[r], code_offs[r + 1], needle, skip)):
+            out[n] = r
+            n += 1
+            if n == out.size:
+                break
+    return n
+
+# Combined stock list, valid for the calendar day recorded in the meta file
+STOCKS_CACHE = CACHE_DIR / "stocks.parquet"
+STOCKS_META = CACHE_DIR / "stocks.meta.json"
+
+def _stocks_cache_fresh() -> bool:
+    try:
+        meta = json.loads(STOCKS_META.read_text())
+        return (
+            STOCKS_CACHE.exists()
+            and meta.get("date") == datetime.date.today().isoformat()
+            and meta.get("markets") == MARKETS
+        )
+    except Exception:
+        return False
+
+def _clear_stock_cache():
+    for path in CACHE_DIR.glob("*.parquet"):
+        path.unlink(missing_ok=True)
+    STOCKS_META.unlink(missing_ok=True)
+
+def _read_stock_cache():
+    # Arrow strings + categorical market round-trip through Parquet
+    stocks = pd.read_parquet(STOCKS_CACHE)
+    meta = json.loads(STOCKS_META.read_text())
+    return stocks, meta.get("version", meta["date"])
+
+def _combine_listings(listings):
+    """Build the stock DataFrame from the per-exchange listings (in MARKETS order) and cache it."""
+    # One pass from the column arrays (no intermediate concat)
+    categories = ['KR', 'US']
+    market_codes = [categories.index(LISTING_MARKETS[name]) for name in MARKETS]
+    sizes = [len(df) for df in listings]
+    n_kr = sum(n for n, m in zip(sizes, market_codes) if m == 0)
+    n_us = sum(n for n, m in zip(sizes, market_codes) if m == 1)
+    stocks = pd.DataFrame({
+        'Code': np.concatenate([df['Code'].to_numpy(dtype=object) for df in listings]),
+        'Name': np.concatenate([df['Name'].to_numpy(dtype=object) for df in listings]),
+        'market': pd.Categorical.from_codes(
+            np.repeat(np.array(market_codes, dtype=np.int8), sizes), categories=categories
+        ),
+    })
+    # Arrow-backed strings: contiguous buffers instead of PyObjects
+    stocks = stocks.astype({'Code': 'string[pyarrow]', 'Name': 'string[pyarrow]'})
+    print(f"Loaded {len(stocks)} stocks (KR: {n_kr}, US: {n_us}).")
+    version = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+    try:
+        stocks.to_parquet(STOCKS_CACHE)
+        STOCKS_META.write_text(json.dumps({"date": datetime.date.today().isoformat(), "markets": MARKETS, "version": version}))
+    except Exception as e:
+        print(f"Failed to cache stock list: {e}")
+    return stocks, version
+
+def _build_index(stocks: pd.DataFrame, version: str) -> StockIndex:
+    # Precompute everything once so endpoints never touch the DataFrame
+    names = stocks['Name'].fillna('').astype(str)
+    codes = stocks['Code'].fillna('').astype(str)
+    name_buf, name_offs = _pack_strings(names)
+    code_buf, code_offs = _pack_strings(codes)
+    codes_lc = codes.str.lower().to_numpy(dtype=str)
+    code_order = np.argsort(codes_lc, kind='stable')
+    raw_codes = codes.to_numpy(dtype=object)
+
+    return StockIndex(
+        name_buf, name_offs, code_buf, code_offs, codes_lc[code_order], code_order,
+        names.to_numpy(dtype=object), raw_codes, stocks['market'].to_numpy(dtype=object),
+        dict(zip(raw_codes, range(len(raw_codes)))),
+        version,
+    )
+
+# Serializes loads: concurrent refreshes would race cache deletion against cache writes
+_stocks_lock = asyncio.Lock()
+
+async def load_stocks(force: bool = False):
+    """(Re)build app.state.stocks from the listings; force=True skips every cache.
+
+    A call made while a load is running waits for it and shares its result.
+    """
+    if _stocks_lock.locked():
+        async with _stocks_lock:
+            return
+    async with _stocks_lock:
+        await _load_stocks(force)
 
-# Supabase Client
-supabase: Client = None
-if SUPABASE_URL and SUPABASE_KEY:
+async def _load_stocks(force: bool):
+    print("Loading stock list from FinanceDataReader...")
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("Supabase client initialized.")
+        # File I/O, Parquet and the index build all run off the event loop
+        if force:
+            await asyncio.to_thread(_clear_stock_cache)
+
+        if _stocks_cache_fresh():
+            stocks, version = await asyncio.to_thread(_read_stock_cache)
+            print(f"Loaded {len(stocks)} stocks from cache.")
+        else:
+            # Load the configured exchanges concurrently; each is an independent download
+            print(f"Loading {', '.join(MARKETS)} stocks (this may take a moment)...")
+            listings = await asyncio.gather(
+                *(asyncio.to_thread(_load_listing_cached, name) for name in MARKETS)
+            )
+            stocks, version = await asyncio.to_thread(_combine_listings, listings)
+
     except Exception as e:
-        print(f"Failed to initialize Supabase: {e}")
+        print(f"Failed to load stock list: {e}")
+        if getattr(app.state, 'stocks', EMPTY_INDEX).codes.size:
+            # Keep serving the previous list rather than dropping to empty
+            return
+        stocks = pd.DataFrame(columns=['Code', 'Name', 'market'])
+        version = "empty"
 
-# ... (Global df_stocks and lifespan)
+    app.state.stocks = await asyncio.to_thread(_build_index, stocks, version)
+    _search_cache.clear()
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
     # Load stock list
-    print("Loading stock list from FinanceDataReader...")
-    global df_stocks
+    await load_stocks()
+
+    # Shared HTTP client (connection pool + keep-alive) for scraping
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=5.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        headers={'User-Agent': USER_AGENT},
+    )
+
+    # Quotes for every held code, kept current in the background (see refresh_prices)
+    app.state.prices = {}
+    refresher = asyncio.create_task(refresh_prices(app)) if supabase else None
     try:
-        # Load KRX
-        df_krx = fdr.StockListing('KRX')
-        df_krx['market'] = 'KR'
-        
-        # Load US Stocks (Major Exchanges)
-        print("Loading US stocks (this may take a moment)...")
-        # Optimization: Load only necessary or cache.
-        df_nasdaq = fdr.StockListing('NASDAQ')
-        df_nyse = fdr.StockListing('NYSE')
-        df_amex = fdr.StockListing('AMEX')
-        
-        df_us = pd.concat([df_nasdaq, df_nyse, df_amex])
-        df_us['market'] = 'US'
-        df_us = df_us.rename(columns={'Symbol': 'Code'})
-        
-        cols = ['Code', 'Name', 'market']
-        df_stocks = pd.concat([df_krx[cols], df_us[cols]])
-        print(f"Loaded {len(df_stocks)} stocks (KR: {len(df_krx)}, US: {len(df_us)}).")
-        
-    except Exception as e:
-        print(f"Failed to load stock list: {e}")
-        df_stocks = pd.DataFrame(columns=['Code', 'Name', 'market'])
-    yield
+        yield
+    finally:
+        if refresher:
+            refresher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await refresher
+        await app.state.http.aclose()
+
+class ORJSONResponse(JSONResponse):
+    # Local equivalent of fastapi.responses.ORJSONResponse (deprecated upstream)
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
-app = FastAPI(lifespan=lifespan)
+async def get_stocks(request: Request) -> StockIndex:
+    # async so FastAPI resolves it inline rather than in the threadpool
+    return getattr(request.app.state, 'stocks', EMPTY_INDEX)
 
 # CORS
 app.add_middleware(
@@ -70,6 +355,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON responses (/search, /history): brotli when accepted, gzip otherwise
+app.add_middleware(BrotliMiddleware, quality=4, minimum_size=512, gzip_fallback=True)
+
 class StockItem(BaseModel):
     name: str
     code: str
@@ -81,6 +369,9 @@ class SearchResponse(BaseModel):
 class HoldingsRequest(BaseModel):
     holdings: List[dict]
 
+class PricesRequest(BaseModel):
+    codes: List[str]
+
 class SnapshotRequest(BaseModel):
     user_id: str
     total_current: float
@@ -120,101 +411,182 @@ def save_holdings(user_id: str, holdings):
         return
 
     try:
-        # Strategy: Delete all for user, then re-insert. 
-        # WARNING: This is risky if insert fails.
-        # Ideally we check schema or use upsert. 
-        # For now, we implement fallback on insert failure to restore data (or at least try to save without new cols).
-        
-        # We can't easily "restore" the deleted data if insert fails unless we kept it in memory (we verify req.holdings has it).
-        
-        # 1. Delete
-        supabase.table('holdings').delete().eq('user_id', user_id).execute()
-        
-        if not holdings:
-            return
+        # Strategy: upsert on (user_id, code), then delete whatever codes the client dropped.
+        # Requires the UNIQUE (user_id, code) constraint from migrations/001_holdings_unique.sql.
+        # Unlike delete-then-insert, a failed write never wipes the user's rows.
 
-        # 2. Prepare for DB (With Market)
-        db_rows_full = []
-        db_rows_fallback = []
-        
-        for h in holdings:
-            base = {
+        # 1. Prepare for DB (With Market); keyed by code so one upsert never hits a key twice
+        rows = list({
+            h.get("code"): {
                 "user_id": user_id,
                 "name": h.get("name"),
                 "code": h.get("code"),
+                "market": h.get("market", "KR"),
                 "buy_price": h.get("buyPrice", 0),
                 "quantity": h.get("quantity", 1)
             }
-            # Full version
-            full = base.copy()
-            full["market"] = h.get("market", "KR")
-            db_rows_full.append(full)
-            
-            # Fallback version
-            db_rows_fallback.append(base)
-            
-        try:
-            supabase.table('holdings').insert(db_rows_full).execute()
-        except Exception as e_full:
-            print(f"Insert with market failed (schema mismatch?): {e_full}. Retrying without market column...")
+            for h in holdings
+        }.values())
+
+        # 2. Upsert
+        if rows:
             try:
-                supabase.table('holdings').insert(db_rows_fallback).execute()
-            except Exception as e_fallback:
-                 print(f"CRITICAL: Fallback insert also failed: {e_fallback}. Data for {user_id} might be lost from DB but exists in payload.")
-                 # In a real app we would raise 500 here so client knows save failed.
-                 raise e_fallback
-        
+                supabase.table('holdings').upsert(rows, on_conflict='user_id,code').execute()
+            except Exception as e_full:
+                print(f"Upsert with market failed (schema mismatch?): {e_full}. Retrying without market column...")
+                try:
+                    fallback = [{k: v for k, v in r.items() if k != "market"} for r in rows]
+                    supabase.table('holdings').upsert(fallback, on_conflict='user_id,code').execute()
+                except Exception as e_fallback:
+                    print(f"CRITICAL: Fallback upsert also failed: {e_fallback}. Existing rows for {user_id} were left untouched.")
+                    # In a real app we would raise 500 here so client knows save failed.
+                    raise e_fallback
+
+        # 3. Delete removed holdings (no read of existing codes needed)
+        query = supabase.table('holdings').delete().eq('user_id', user_id)
+        if rows:
+            query = query.not_.in_('code', [r["code"] for r in rows])
+        query.execute()
+
     except Exception as e:
         print(f"Error saving holdings to Supabase: {e}")
 
 @app.get("/holdings/{user_id}")
-def get_holdings(user_id: str):
-    return load_holdings(user_id)
+async def get_holdings(user_id: str):
+    return await asyncio.to_thread(load_holdings, user_id)
 
 @app.post("/holdings/{user_id}")
-def update_holdings(user_id: str, req: HoldingsRequest):
-    save_holdings(user_id, req.holdings)
+async def update_holdings(user_id: str, req: HoldingsRequest):
+    await asyncio.to_thread(save_holdings, user_id, req.holdings)
     return {"status": "success", "count": len(req.holdings)}
 
+# Accepted input shapes, checked before any work. Search matching is a literal byte scan
+# (no regex engine), so this is about bounding length and junk; the set still covers
+# names like "S&T홀딩스", "AT&T" or "KODEX 200선물인버스2X" and jamo typed mid-composition.
+QUERY_RE = re.compile(r"[0-9A-Za-z가-힣ㄱ-ㅎㅏ-ㅣ\s.,&'()/+\-]{1,32}")
+# Listing codes: 005930, AAPL, BRK.B, BRK-B; also what gets put into the Naver URL
+CODE_RE = re.compile(r"[0-9A-Za-z.\-]{1,16}")
+
+# Recent /search results by lowercase query (typeahead repeats prefixes constantly)
+SEARCH_CACHE_SIZE = 1000
+_search_cache: OrderedDict = OrderedDict()
+
+# Results depend only on the query and the stock list build, so browsers/CDNs may reuse them
+SEARCH_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=86400"
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Weak comparison (RFC 9110): the compression middleware re-encodes the body
+    if not if_none_match:
+        return False
+    tags = {t.strip().removeprefix('W/') for t in if_none_match.split(',')}
+    return '*' in tags or etag.removeprefix('W/') in tags
+
 @app.get("/search")
-def search_stock(q: str):
-    if not q:
+async def search_stock(
+    q: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    stocks: StockIndex = Depends(get_stocks),
+):
+    # A single ASCII letter/digit matches a large share of the listing, so don't bother;
+    # one Hangul syllable (3 UTF-8 bytes) is selective enough to keep
+    if len(q.encode('utf-8')) < 2 or not QUERY_RE.fullmatch(q):
+        return {"items": []}
+    if stocks.codes.size == 0:
+        # Stock list not loaded (yet): an empty answer must not outlive the reload
+        response.headers["Cache-Control"] = "no-store"
         return {"items": []}
 
+    ql = q.lower()
+    digest = hashlib.blake2b(ql.encode('utf-8'), digest_size=8).hexdigest()
+    etag = f'W/"{stocks.version}-{digest}"'
+    cache_headers = {"ETag": etag, "Cache-Control": SEARCH_CACHE_CONTROL}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=cache_headers)
+    response.headers.update(cache_headers)
+
+    items = _search_cache.get(ql)
+    if items is not None:
+        _search_cache.move_to_end(ql)
+        return {"items": items}
+
     try:
-        if df_stocks.empty:
-            return {"items": []}
-
-        # Simple containment search
-        # Limit to top 20 matches
-        # Check Name or Code
-        mask = df_stocks['Name'].str.contains(q, case=False, na=False) | \
-               df_stocks['Code'].str.contains(q, case=False, na=False)
-        
-        results = df_stocks[mask].head(20)
-        
-        items = []
-        for _, row in results.iterrows():
-            items.append({
-                "name": row['Name'],
-                "code": row['Code'],
-                "market": row['market']
-            })
-        
+        # Code prefix matches first (binary search over the sorted codes; exact match sorts first)
+        lo = np.searchsorted(stocks.sorted_codes, ql, side='left')
+        hi = np.searchsorted(stocks.sorted_codes, ql + '\uffff', side='right')
+        prefix_idx = stocks.code_order[lo:min(hi, lo + 20)]
+
+        # Then containment on Name or Code (case-insensitive), up to 20 in total
+        needle = np.frombuffer(bytearray(ql.encode('utf-8')), dtype=np.uint8)
+        found = np.empty(20 + prefix_idx.size, dtype=np.int64)
+        found = found[:_search(stocks.name_buf, stocks.name_offs, stocks.code_buf, stocks.code_offs, needle, found)]
+        rest = found[~np.isin(found, prefix_idx)]
+        idx = np.concatenate([prefix_idx, rest])[:20]
+
+        rows = zip(stocks.names[idx], stocks.codes[idx], stocks.markets[idx])
+        items = [{"name": n, "code": c, "market": m} for n, c, m in rows]
+
+        _search_cache[ql] = items
+        if len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
         return {"items": items}
 
     except Exception as e:
         print(f"Error searching: {e}")
+        # Don't let a failed lookup be cached downstream
+        del response.headers["ETag"]
+        response.headers["Cache-Control"] = "no-store"
         return {"items": []}
 
+@app.post("/admin/refresh-stocks")
+async def refresh_stocks(x_admin_token: Optional[str] = Header(None)):
+    # Disabled unless ADMIN_TOKEN is configured
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+    # Invalidate the on-disk listing caches and rebuild from FinanceDataReader
+    await load_stocks(force=True)
+    return {"status": "success", "count": len(app.state.stocks.codes)}
+
+# In-flight fetches by cache key, so concurrent misses share a single upstream call
+_inflight: dict = {}
+
+async def _cached_fetch(cache: TTLCache, key, fetch):
+    """Return cache[key], else await fetch() once across concurrent callers; errors aren't cached."""
+    if key in cache:
+        return cache[key]
+
+    inflight_key = (id(cache), key)
+    task = _inflight.get(inflight_key)
+    if task is None:
+        async def run():
+            result = await fetch()
+            if "error" not in result:
+                cache[key] = result
+            return result
+
+        task = asyncio.create_task(run())
+        _inflight[inflight_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(inflight_key, None))
+    # shield: one cancelled client must not cancel the fetch others are awaiting
+    return await asyncio.shield(task)
+
+# USD/KRW barely moves intraday
+fx_cache = TTLCache(maxsize=1, ttl=300)
+
 @app.get("/exchange-rate")
-def get_exchange_rate():
+async def get_exchange_rate():
+    return await _cached_fetch(fx_cache, 'USD/KRW', _fetch_exchange_rate)
+
+async def _fetch_exchange_rate():
     try:
         # Use FinanceDataReader for USD/KRW
         # Symbol is 'USD/KRW'
         today = datetime.datetime.now()
         start = today - datetime.timedelta(days=7) 
-        df = fdr.DataReader('USD/KRW', start)
+        df = await asyncio.to_thread(fdr.DataReader, 'USD/KRW', start)
         
         if df.empty:
             return {"rate": 1400.0, "error": "No data"}
@@ -225,21 +597,25 @@ def get_exchange_rate():
         print(f"Exchange rate error: {e}")
         return {"rate": 1400.0, "error": str(e)}
 
+# Short-lived quote cache; 30s is fresher than the dashboard needs
+price_cache = TTLCache(maxsize=4096, ttl=30)
+
+async def load_price(code: str, market: str):
+    return await _cached_fetch(price_cache, code, lambda: _fetch_price(code, market))
+
 @app.get("/price")
-def get_price(code: str):
+async def get_price(code: str, stocks: StockIndex = Depends(get_stocks)):
     if not code:
         raise HTTPException(status_code=400, detail="Code is required")
-
+    if not CODE_RE.fullmatch(code):
+        raise HTTPException(status_code=400, detail="Invalid code")
+    quote = app.state.prices.get(code)
+    if quote is not None:
+        return quote
+    return await load_price(code, stocks.market_of(code))
+
+async def _fetch_price(code: str, market: str):
     try:
-        # Determine market
-        market = 'KR'
-        if not df_stocks.empty:
-            found = df_stocks[df_stocks['Code'] == code]
-            if not found.empty:
-                market = found.iloc[0]['market']
-        
-        # print(f"DEBUG: Code={code}, Market={market}") 
-
         if market == 'US':
             # US Stock Logic via FDR
             try:
@@ -247,27 +623,12 @@ def get_price(code: str):
                 today = datetime.datetime.now()
                 start = today - datetime.timedelta(days=14)
                 
-                df = fdr.DataReader(code, start)
+                df = await asyncio.to_thread(fdr.DataReader, code, start)
                 if df.empty:
                     raise ValueError(f"Empty data returned for {code}")
-                
-                last_row = df.iloc[-1]
-                # If only 1 row, prev is same (0 change)
-                prev_row = df.iloc[-2] if len(df) > 1 else last_row
-                
-                price = float(last_row['Close'])
-                prev_close = float(prev_row['Close'])
-                change = price - prev_close
-                rate = 0.0
-                if prev_close != 0:
-                    rate = (change / prev_close) * 100
-                
-                return {
-                    "code": code,
-                    "price": price,
-                    "rate": rate,
-                    "change": f"{change:.2f}"
-                }
+
+                # Raw Close array: no per-row Series construction
+                return _quote_from_closes(code, df['Close'].to_numpy(dtype=float))
             except Exception as UsEx:
                 print(f"US Stock fetch error for {code}: {UsEx}")
                 return {"code": code, "price": 0, "rate": 0, "change": "0", "error": str(UsEx)} 
@@ -275,35 +636,16 @@ def get_price(code: str):
         else:
             # KR Stock Logic via Naver
             url = f"https://finance.naver.com/item/main.naver?code={code}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36'
-            }
-            
-            response = requests.get(url, headers=headers)
-            response.encoding = 'EUC-KR'
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            no_today = soup.select_one('.no_today')
-            if not no_today:
+
+            response = await app.state.http.get(url)
+
+            parsed = _parse_naver_regex(response.content) or _parse_naver_lxml(response.content)
+            if not parsed:
                  return {"code": code, "price": 0, "rate": 0, "change": "0", "error": "KR Data parse fail"}
-                 
-            price_span = no_today.select_one('.blind')
-            price_text = price_span.get_text(strip=True).replace(',', '')
-            price = int(price_text)
-            
-            no_exday = soup.select_one('.no_exday')
-            blinds = no_exday.select('.blind')
-            
-            change_text = "0"
-            rate_text = "0"
-            if len(blinds) >= 2:
-                change_text = blinds[0].get_text(strip=True)
-                rate_text = blinds[1].get_text(strip=True)
-            
-            is_up = bool(no_exday.select('.ico.up') or no_exday.select('.ico.upper'))
-            is_down = bool(no_exday.select('.ico.down') or no_exday.select('.ico.low'))
-            
+
+            price_text, change_text, rate_text, is_up, is_down = parsed
+            price = int(price_text.replace(',', ''))
+
             rate = float(rate_text)
             if is_down:
                 rate = -abs(rate)
@@ -321,48 +663,187 @@ def get_price(code: str):
         print(f"Error fetching price for {code}: {e}")
         return {"code": code, "price": 0, "rate": 0, "change": "0", "error": str(e)}
 
+# Yahoo accepts up to 20 symbols per multi-ticker request
+US_BATCH_SIZE = 20
+
+def _quote_from_closes(code: str, closes):
+    closes = closes[~np.isnan(closes)]
+    if closes.size == 0:
+        return {"code": code, "price": 0, "rate": 0, "change": "0", "error": f"Empty data returned for {code}"}
+
+    price = float(closes[-1])
+    # If only 1 row, prev is same (0 change)
+    prev_close = float(closes[-2]) if closes.size > 1 else price
+    change = price - prev_close
+    rate = 0.0
+    if prev_close != 0:
+        rate = (change / prev_close) * 100
+
+    return {
+        "code": code,
+        "price": price,
+        "rate": rate,
+        "change": f"{change:.2f}"
+    }
+
+def get_batch_us_prices(codes: List[str]):
+    """Fetch US quotes with one yfinance download per chunk of 20 symbols."""
+    today = datetime.datetime.now()
+    start = today - datetime.timedelta(days=14)
+
+    results = {}
+    for i in range(0, len(codes), US_BATCH_SIZE):
+        chunk = codes[i:i + US_BATCH_SIZE]
+        try:
+            # Unadjusted closes, like fdr.DataReader on the single /price path, so both
+            # report the same change/rate on ex-dividend and split days
+            df = yf.download(
+                ' '.join(chunk), start=start, group_by='ticker', threads=True, progress=False, auto_adjust=False
+            )
+        except Exception as e:
+            print(f"US batch fetch error for {chunk}: {e}")
+            for code in chunk:
+                results[code] = {"code": code, "price": 0, "rate": 0, "change": "0", "error": str(e)}
+            continue
+
+        for code in chunk:
+            if df is None or df.empty:
+                closes = np.array([], dtype=float)
+            elif isinstance(df.columns, pd.MultiIndex):
+                if code in df.columns.get_level_values(0):
+                    closes = df[code]['Close'].to_numpy(dtype=float)
+                else:
+                    closes = np.array([], dtype=float)
+            else:
+                closes = df['Close'].to_numpy(dtype=float)
+            results[code] = _quote_from_closes(code, closes)
+
+    return results
+
+async def load_prices(codes: List[str], stocks: StockIndex):
+    """Quotes for many codes, from the background/TTL caches where possible."""
+    code_list = list(dict.fromkeys(c.strip() for c in codes if c and c.strip()))
+    if not code_list:
+        raise HTTPException(status_code=400, detail="Codes are required")
+
+    results = {}
+    missing = []
+    for code in code_list:
+        if not CODE_RE.fullmatch(code):
+            # Per-code failure, like a failed fetch; the rest of the batch still resolves
+            results[code] = {"code": code, "price": 0, "rate": 0, "change": "0", "error": "Invalid code"}
+            continue
+        quote = app.state.prices.get(code) or price_cache.get(code)
+        if quote is not None:
+            results[code] = quote
+        else:
+            missing.append(code)
+    results.update(await _fetch_quotes(missing, stocks))
+
+    # Keep request order
+    return {code: results[code] for code in code_list}
+
+async def _fetch_quotes(codes: List[str], stocks: StockIndex, kr_concurrency: Optional[int] = None):
+    """One batched yfinance call for the US codes, concurrent Naver scrapes for KR.
+
+    kr_concurrency caps how many Naver scrapes are in flight at once (default: no cap).
+    """
+    us_codes = []
+    kr_codes = []
+    for code in codes:
+        if stocks.market_of(code) == 'US':
+            us_codes.append(code)
+        else:
+            kr_codes.append(code)
+
+    async def fetch_us():
+        if not us_codes:
+            return {}
+        batch = await asyncio.to_thread(get_batch_us_prices, us_codes)
+        for code, quote in batch.items():
+            if "error" not in quote:
+                price_cache[code] = quote
+        return batch
+
+    kr_limit = asyncio.Semaphore(kr_concurrency) if kr_concurrency else contextlib.nullcontext()
+
+    async def fetch_kr(code):
+        async with kr_limit:
+            return await load_price(code, 'KR')
+
+    us_results, *kr_results = await asyncio.gather(
+        fetch_us(), *(fetch_kr(code) for code in kr_codes)
+    )
+    return {**us_results, **dict(zip(kr_codes, kr_results))}
+
+# Held codes are re-quoted on this period (matches price_cache's TTL)
+PRICE_REFRESH_INTERVAL = 30
+# Naver scrapes in flight at once per refresh cycle
+REFRESH_KR_CONCURRENCY = 8
+
+async def refresh_prices(app: FastAPI):
+    """Keep app.state.prices current for every code in anyone's holdings, plus USD/KRW."""
+    while True:
+        try:
+            # Distinct codes as one array (migrations/004_held_codes.sql), not capped by max-rows
+            resp = await asyncio.to_thread(supabase.rpc('held_codes', {}).execute)
+            # Holdings are user-written: only refresh well-formed codes that are actually listed
+            stocks = app.state.stocks
+            codes = [c for c in resp.data or [] if CODE_RE.fullmatch(c) and c in stocks.code_to_idx]
+            # Evict first so the KR scrapes go upstream instead of hitting price_cache
+            for code in codes:
+                price_cache.pop(code, None)
+            quotes = await _fetch_quotes(codes, stocks, kr_concurrency=REFRESH_KR_CONCURRENCY)
+            # Replace wholesale: sold codes drop out, failed ones fall back to on-demand fetches
+            app.state.prices = {code: q for code, q in quotes.items() if "error" not in q}
+            await _cached_fetch(fx_cache, 'USD/KRW', _fetch_exchange_rate)
+        except Exception as e:
+            print(f"Price refresh error: {e}")
+            # Don't keep serving quotes that are no longer being refreshed
+            app.state.prices = {}
+        await asyncio.sleep(PRICE_REFRESH_INTERVAL)
+
+@app.get("/prices")
+async def get_prices(codes: str, stocks: StockIndex = Depends(get_stocks)):
+    return await load_prices(codes.split(','), stocks)
+
+@app.post("/prices")
+async def post_prices(req: PricesRequest, stocks: StockIndex = Depends(get_stocks)):
+    return await load_prices(req.codes, stocks)
+
 @app.post("/history/snapshot")
-def save_snapshot(req: SnapshotRequest):
+async def save_snapshot(req: SnapshotRequest):
     if not supabase:
         raise HTTPException(status_code=503, detail="Database unavailable")
     
     try:
-        daily_return = req.total_current - req.total_invested
-        daily_return_rate = 0
-        if req.total_invested > 0:
-            daily_return_rate = (daily_return / req.total_invested) * 100
-        
         # Check recent snapshot (1 hr check)
         # Note: logic simplified for robustness
         should_update = False
         update_id = None
         
-        last_record_resp = supabase.table("portfolio_history")\
-            .select("id, created_at")\
-            .eq("user_id", req.user_id)\
-            .order("created_at", desc=True)\
-            .limit(1)\
-            .execute()
-            
+        # Let Postgres apply the window: only a snapshot from the last hour comes back,
+        # so there's no created_at string to parse here
+        one_hour_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+        last_record_resp = await asyncio.to_thread(
+            supabase.table("portfolio_history")
+            .select("id")
+            .eq("user_id", req.user_id)
+            .gte("created_at", one_hour_ago.isoformat())
+            .order("created_at", desc=True)
+            .limit(1)
+            .execute
+        )
+
         if last_record_resp.data:
-            last = last_record_resp.data[0]
-            try:
-                last_time_str = last['created_at'].replace('Z', '+00:00')
-                last_time = datetime.datetime.fromisoformat(last_time_str)
-                now = datetime.datetime.now(datetime.timezone.utc)
-                diff = (now - last_time).total_seconds()
-                if diff < 3600:
-                    should_update = True
-                    update_id = last['id']
-            except:
-                pass
+            should_update = True
+            update_id = last_record_resp.data[0]['id']
 
         data = {
             "user_id": req.user_id,
             "total_current_value": req.total_current,
             "total_invested_value": req.total_invested,
-            "daily_return": daily_return,
-            "daily_return_rate": daily_return_rate,
+            # daily_return / daily_return_rate are generated columns (migrations/002)
             "kr_current_value": req.kr_current,
             "kr_invested_value": req.kr_invested,
             "us_current_value": req.us_current,
@@ -371,9 +852,9 @@ def save_snapshot(req: SnapshotRequest):
         }
         
         if should_update and update_id:
-            supabase.table("portfolio_history").update(data).eq("id", update_id).execute()
+            await asyncio.to_thread(supabase.table("portfolio_history").update(data).eq("id", update_id).execute)
         else:
-            supabase.table("portfolio_history").insert(data).execute()
+            await asyncio.to_thread(supabase.table("portfolio_history").insert(data).execute)
             
         return {"status": "success", "action": "update" if should_update else "insert"}
 
@@ -382,49 +863,30 @@ def save_snapshot(req: SnapshotRequest):
         return {"status": "error", "message": str(e)}
 
 @app.get("/history/{user_id}")
-def get_history(user_id: str, range: str = '1M'):
+async def get_history(user_id: str, range: str = '1M'):
     if not supabase:
         return []
 
     try:
-        # Determine date filter
-        today = datetime.date.today()
-        start_date = today
-        
-        if range == '1W':
-            start_date = today - datetime.timedelta(days=7)
-        elif range == '1M':
-            start_date = today - datetime.timedelta(days=30)
-        elif range == '3M':
-            start_date = today - datetime.timedelta(days=90)
-        elif range == '1Y':
-            start_date = today - datetime.timedelta(days=365)
-        else:
-            start_date = today - datetime.timedelta(days=365*10) # 'ALL'
-
-        response = supabase.table("portfolio_history")\
-            .select("created_at, date, total_current_value, total_invested_value, daily_return, daily_return_rate, kr_current_value, us_current_value, kr_invested_value, us_invested_value")\
-            .eq("user_id", user_id)\
-            .gte("date", start_date.isoformat())\
-            .order("created_at", desc=False)\
-            .execute()
-            
-        # Calculate returns for each row
-        results = []
-        for row in response.data:
-            item = row.copy()
-            # Calculate Split Returns if data exists
-            if item.get('kr_current_value') is not None and item.get('kr_invested_value') is not None:
-                item['kr_return'] = item['kr_current_value'] - item['kr_invested_value']
-                item['kr_rate'] = (item['kr_return'] / item['kr_invested_value'] * 100) if item['kr_invested_value'] > 0 else 0
-            
-            if item.get('us_current_value') is not None and item.get('us_invested_value') is not None:
-                item['us_return'] = item['us_current_value'] - item['us_invested_value']
-                item['us_rate'] = (item['us_return'] / item['us_invested_value'] * 100) if item['us_invested_value'] > 0 else 0
-                
-            results.append(item)
-            
-        return results
+        # Date window is resolved server-side (migrations/003_get_portfolio_history.sql)
+        response = await asyncio.to_thread(supabase.rpc('get_portfolio_history', {'uid': user_id, 'r': range}).execute)
+
+        if not response.data:
+            return []
+
+        # Calculate returns column-wise; null values stay null (NaN serializes as null)
+        df = pd.DataFrame(response.data)
+        for prefix in ('kr', 'us'):
+            current = df[f'{prefix}_current_value'].astype(float)
+            invested = df[f'{prefix}_invested_value'].astype(float)
+            ret = current - invested
+            df[f'{prefix}_return'] = ret
+            df[f'{prefix}_rate'] = np.where(invested > 0, ret / invested.where(invested > 0) * 100, 0)
+            df.loc[ret.isna(), f'{prefix}_rate'] = np.nan
+        results = df.to_dict('records')
+
+        # Plain Python/NumPy scalars: serialize directly, skipping jsonable_encoder
+        return ORJSONResponse(results)
 
     except Exception as e:
         print(f"History fetch error: {e}")
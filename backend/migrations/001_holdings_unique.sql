@@ -0,0 +1,10 @@
+-- One row per (user_id, code) so save_holdings can upsert instead of delete + insert.
+-- Remove any duplicate rows first, keeping one per (user_id, code).
+DELETE FROM holdings a
+USING holdings b
+WHERE a.user_id = b.user_id
+  AND a.code = b.code
+  AND a.ctid < b.ctid;
+
+ALTER TABLE holdings
+  ADD CONSTRAINT holdings_user_id_code_key UNIQUE (user_id, code);
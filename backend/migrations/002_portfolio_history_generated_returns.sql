@@ -0,0 +1,15 @@
+-- Compute the portfolio return columns in Postgres so save_snapshot doesn't send them.
+ALTER TABLE portfolio_history
+  DROP COLUMN IF EXISTS daily_return,
+  DROP COLUMN IF EXISTS daily_return_rate;
+
+ALTER TABLE portfolio_history
+  ADD COLUMN daily_return numeric
+    GENERATED ALWAYS AS (total_current_value - total_invested_value) STORED,
+  ADD COLUMN daily_return_rate numeric
+    GENERATED ALWAYS AS (
+      CASE WHEN total_invested_value > 0
+        THEN (total_current_value - total_invested_value) / total_invested_value * 100
+        ELSE 0
+      END
+    ) STORED;
@@ -0,0 +1,41 @@
+-- History for one user over a range code ('1W', '1M', '3M', '1Y', anything else = 'ALL').
+-- Used by GET /history/{user_id}; the date window is computed server-side.
+CREATE OR REPLACE FUNCTION get_portfolio_history(uid text, r text)
+RETURNS TABLE (
+  created_at timestamptz,
+  date date,
+  total_current_value float8,
+  total_invested_value float8,
+  daily_return float8,
+  daily_return_rate float8,
+  kr_current_value float8,
+  us_current_value float8,
+  kr_invested_value float8,
+  us_invested_value float8
+)
+LANGUAGE sql STABLE
+AS $$
+  SELECT
+    h.created_at::timestamptz,
+    h.date::date,
+    h.total_current_value::float8,
+    h.total_invested_value::float8,
+    h.daily_return::float8,
+    h.daily_return_rate::float8,
+    h.kr_current_value::float8,
+    h.us_current_value::float8,
+    h.kr_invested_value::float8,
+    h.us_invested_value::float8
+  FROM portfolio_history h
+  WHERE h.user_id = uid
+    AND h.date >= CURRENT_DATE - (
+      CASE r
+        WHEN '1W' THEN 7
+        WHEN '1M' THEN 30
+        WHEN '3M' THEN 90
+        WHEN '1Y' THEN 365
+        ELSE 3650
+      END
+    ) * interval '1 day'
+  ORDER BY h.created_at
+$$;
@@ -0,0 +1,11 @@
+-- Distinct codes across everyone's holdings, for the background price refresher.
+-- Returned as one array value rather than a row set, so PostgREST's max-rows cap
+-- (1000 on Supabase) can't truncate it.
+CREATE OR REPLACE FUNCTION held_codes()
+RETURNS text[]
+LANGUAGE sql STABLE
+AS $$
+  SELECT COALESCE(array_agg(DISTINCT h.code::text ORDER BY h.code::text), '{}')
+  FROM holdings h
+  WHERE h.code IS NOT NULL AND h.code <> ''
+$$;